@@ -1,11 +1,18 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
+import io
 import os
 import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from gmail_client import GmailClient
 from email_parser import OrderEmailParser
 
+# Emails handed to each parser worker at a time
+PARSE_CHUNK_SIZE = 16
+
 # Page configuration
 st.set_page_config(
     page_title="Gmail Order Tracker",
@@ -13,6 +20,11 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_parser() -> OrderEmailParser:
+    """Shared parser instance; it only holds precompiled patterns, so one serves all sessions"""
+    return OrderEmailParser()
+
 def init_session_state():
     """Initialize session state variables"""
     if 'authenticated' not in st.session_state:
@@ -21,6 +33,8 @@ def init_session_state():
         st.session_state.gmail_client = None
     if 'orders_df' not in st.session_state:
         st.session_state.orders_df = None
+    if 'orders_key' not in st.session_state:
+        st.session_state.orders_key = None
     if 'processing' not in st.session_state:
         st.session_state.processing = False
 
@@ -36,9 +50,15 @@ def main():
         if st.session_state.authenticated:
             st.success("✅ Connected to Gmail")
             if st.button("Disconnect", type="secondary"):
+                # Don't leave this account's mail on disk for the next user
+                try:
+                    st.session_state.gmail_client.clear_cache()
+                except Exception as e:
+                    st.warning(f"Could not clear cached emails: {str(e)}")
                 st.session_state.authenticated = False
                 st.session_state.gmail_client = None
                 st.session_state.orders_df = None
+                st.session_state.orders_key = None
                 st.rerun()
         else:
             st.warning("❌ Not connected to Gmail")
@@ -74,7 +94,7 @@ def show_authentication_section():
         return
     
     # Check if we have stored credentials first
-    if os.path.exists('token.pickle'):
+    if os.path.exists(GmailClient.TOKEN_FILE) or os.path.exists(GmailClient.LEGACY_TOKEN_FILE):
         try:
             gmail_client = GmailClient()
             if gmail_client.authenticate():
@@ -116,11 +136,12 @@ def show_order_extraction_section():
         days_back = st.slider("Days to look back", min_value=1, max_value=90, value=30)
     with col2:
         max_emails = st.slider("Maximum emails to process", min_value=50, max_value=1000, value=200)
+    show_debug = st.checkbox("Show processing details", value=False)
     
     if st.button("🔍 Extract Orders", type="primary", disabled=st.session_state.processing):
         st.write("🔄 Button clicked - starting extraction...")
         try:
-            extract_orders(days_back, max_emails)
+            extract_orders(days_back, max_emails, show_debug)
         except Exception as e:
             st.error(f"❌ Critical error in extraction: {str(e)}")
             import traceback
@@ -130,7 +151,30 @@ def show_order_extraction_section():
     if st.session_state.orders_df is not None:
         display_orders_table()
 
-def extract_orders(days_back: int, max_emails: int):
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=10000)
+def parse_cached(msg_id: str, _parser: OrderEmailParser, _email: dict, _is_order):
+    """Parse one email, memoized by Gmail message ID since messages never change
+    
+    Underscored arguments are not hashed by Streamlit, so the cache key is
+    just the message ID.
+    """
+    return _parser.parse_email(_email, is_order=_is_order)
+
+def parse_chunk(parser: OrderEmailParser, emails: list, decisions: list) -> list:
+    """Parse a slice of emails on a worker thread, returning (order_info, error) pairs"""
+    results = []
+    for email, is_order in zip(emails, decisions):
+        try:
+            if email.get('id'):
+                order_info = parse_cached(email['id'], parser, email, is_order)
+            else:
+                order_info = parser.parse_email(email, is_order=is_order)
+            results.append((order_info, None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def extract_orders(days_back: int, max_emails: int, show_debug: bool = False):
     """Extract orders from Gmail emails"""
     st.session_state.processing = True
     
@@ -171,56 +215,84 @@ def extract_orders(days_back: int, max_emails: int):
         
         with st.spinner("Parsing emails for order information..."):
             # Parse emails for order information
-            parser = OrderEmailParser()
+            parser = get_parser()
             orders = []
             
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            # Debug container
-            debug_expander = st.expander("🔍 Processing Details", expanded=True)
+            # Settle the order check for the whole batch from subjects/senders at once
+            decisions = parser.prefilter(emails)
             
-            for i, email in enumerate(emails):
-                try:
-                    progress = (i + 1) / len(emails)
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing email {i + 1}/{len(emails)}: {email.get('subject', 'No subject')[:50]}...")
-                    
-                    # Debug: Show what we're processing
-                    with debug_expander:
-                        st.write(f"**Email {i + 1}:** {email.get('subject', 'No subject')}")
-                        st.write(f"From: {email.get('sender', 'Unknown')}")
-                    
-                    order_info = parser.parse_email(email)
-                    
-                    if order_info:
-                        orders.append(order_info)
-                        with debug_expander:
-                            st.success(f"✅ Found order: {order_info.get('order_id', 'No ID')} from {order_info.get('seller', 'Unknown')}")
-                    else:
-                        with debug_expander:
-                            st.info("ℹ️ No order info extracted from this email")
-                            
-                except Exception as e:
-                    with debug_expander:
-                        st.error(f"❌ Error parsing email {i + 1}: {str(e)}")
-                    continue
+            # Parse chunks on worker threads; parse errors come back as results
+            # so widgets are only touched from this thread
+            results = [None] * len(emails)
+            done = 0
+            with ThreadPoolExecutor(
+                max_workers=min(8, os.cpu_count() or 4),
+                initializer=add_script_run_ctx,
+                initargs=(None, get_script_run_ctx())
+            ) as executor:
+                futures = {
+                    executor.submit(parse_chunk, parser, emails[start:start + PARSE_CHUNK_SIZE],
+                                    decisions[start:start + PARSE_CHUNK_SIZE]): start
+                    for start in range(0, len(emails), PARSE_CHUNK_SIZE)
+                }
+                for future in as_completed(futures):
+                    start = futures[future]
+                    chunk_results = future.result()
+                    results[start:start + len(chunk_results)] = chunk_results
+                    done += len(chunk_results)
+                    progress_bar.progress(done / len(emails))
+                    status_text.text(f"Processed {done}/{len(emails)} emails")
+            
+            debug_rows = []
+            parse_errors = []
+            for i, (email, (order_info, error)) in enumerate(zip(emails, results)):
+                if order_info:
+                    orders.append(order_info)
+                    result = f"✅ {order_info.get('order_id') or 'No ID'} from {order_info.get('seller', 'Unknown')}"
+                elif error:
+                    parse_errors.append((email.get('subject', 'No subject'), error))
+                    result = f"❌ Error: {str(error)}"
+                else:
+                    result = "ℹ️ No order info extracted"
+                
+                if show_debug:
+                    debug_rows.append({
+                        'email': i + 1,
+                        'subject': email.get('subject', 'No subject'),
+                        'from': email.get('sender', 'Unknown'),
+                        'result': result
+                    })
             
             progress_bar.empty()
             status_text.empty()
             
-            # Summary
-            with debug_expander:
-                st.write(f"**Summary:** Processed {len(emails)} emails, found {len(orders)} orders")
+            if parse_errors:
+                with st.expander(f"⚠️ Emails that could not be parsed ({len(parse_errors)})"):
+                    for subject, error in parse_errors:
+                        st.write(f"Error parsing email \"{subject}\": {str(error)}")
+            
+            # Debug details, rendered once after the loop
+            if show_debug:
+                with st.expander("🔍 Processing Details", expanded=True):
+                    st.dataframe(pd.DataFrame(debug_rows), use_container_width=True, hide_index=True)
+                    st.write(f"**Summary:** Processed {len(emails)} emails, found {len(orders)} orders")
             
             if orders:
                 # Create DataFrame
-                df = pd.DataFrame(orders)
+                df = parser.fill_missing_order_ids(pd.DataFrame(orders))
+                # Few distinct values, so categoricals make filtering and unique() cheap
+                df['seller'] = df['seller'].astype('category')
+                df['status'] = df['status'].astype('category')
                 st.session_state.orders_df = df
+                st.session_state.orders_key = uuid.uuid4().hex
                 st.success(f"✅ Successfully extracted {len(orders)} orders!")
             else:
                 st.warning("⚠️ No order information found in the selected emails")
                 st.session_state.orders_df = pd.DataFrame()
+                st.session_state.orders_key = uuid.uuid4().hex
     
     except Exception as e:
         st.error(f"❌ Error extracting orders: {str(e)}")
@@ -231,6 +303,31 @@ def extract_orders(days_back: int, max_emails: int):
     finally:
         st.session_state.processing = False
 
+@st.cache_resource(show_spinner=False, max_entries=50)
+def filter_orders(orders_key: str, _df: pd.DataFrame, sellers: tuple, statuses: tuple, sort_by: str) -> pd.DataFrame:
+    """Filtered and sorted view of the orders table
+    
+    Keyed on orders_key, a token regenerated with every extraction, so the
+    frame itself is never hashed. A cache resource rather than cache data,
+    so hits hand back the stored frame instead of unpickling a fresh copy;
+    callers must treat it as read-only.
+    """
+    df = _df
+    if sellers:
+        df = df[df['seller'].isin(sellers)]
+    if statuses:
+        df = df[df['status'].isin(statuses)]
+    
+    # Sort data
+    return df.sort_values(by=sort_by, ascending=False)
+
+@st.cache_data(show_spinner=False, max_entries=50)
+def orders_csv(view_key: tuple, _df: pd.DataFrame) -> bytes:
+    """CSV export of an orders view, serialized once per view rather than on every rerun"""
+    buf = io.BytesIO()
+    _df.to_csv(buf, index=False)
+    return buf.getvalue()
+
 def display_orders_table():
     """Display the orders table"""
     st.header("📋 Order Information")
@@ -239,7 +336,8 @@ def display_orders_table():
         st.info("No orders found in the processed emails.")
         return
     
-    df = st.session_state.orders_df.copy()
+    # Nothing below mutates the frame in place, so no defensive copy is needed
+    df = st.session_state.orders_df
     
     # Add filters
     col1, col2, col3 = st.columns(3)
@@ -262,14 +360,8 @@ def display_orders_table():
             index=0
         )
     
-    # Apply filters
-    if sellers:
-        df = df[df['seller'].isin(sellers)]
-    if statuses:
-        df = df[df['status'].isin(statuses)]
-    
-    # Sort data
-    df = df.sort_values(by=sort_by, ascending=False)
+    # Apply filters and sort
+    df = filter_orders(st.session_state.orders_key, df, tuple(sellers), tuple(statuses), sort_by)
     
     # Display summary statistics
     col1, col2, col3, col4 = st.columns(4)
@@ -277,12 +369,12 @@ def display_orders_table():
         st.metric("Total Orders", len(df))
     with col2:
         st.metric("Unique Sellers", df['seller'].nunique())
+    # Plain substring test, evaluated once per category rather than per row
+    delivered_count = int(df['status'].str.contains('delivered', case=False, regex=False, na=False).sum())
     with col3:
-        delivered_count = len(df[df['status'].str.contains('Delivered|delivered', na=False)])
         st.metric("Delivered Orders", delivered_count)
     with col4:
-        pending_count = len(df[~df['status'].str.contains('Delivered|delivered', na=False)])
-        st.metric("Pending Orders", pending_count)
+        st.metric("Pending Orders", len(df) - delivered_count)
     
     # Display the table with order ID prominently shown
     st.dataframe(
@@ -300,10 +392,10 @@ def display_orders_table():
     
     # Download option
     if not df.empty:
-        csv = df.to_csv(index=False)
+        view_key = (st.session_state.orders_key, tuple(sellers), tuple(statuses), sort_by)
         st.download_button(
             label="📥 Download CSV",
-            data=csv,
+            data=orders_csv(view_key, df),
             file_name=f"gmail_orders_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
             mime="text/csv"
         )
@@ -1,161 +1,353 @@
 import re
+from bisect import bisect_right
 import html
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Tuple, Any
+import pandas as pd
 from bs4 import BeautifulSoup
-import streamlit as st
+
+# Common order-related patterns, compiled once at import time
+_ORDER_ID_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in [
+    # Order number patterns
+    r'order\s*(?:#|number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
+    r'order\s+([a-zA-Z0-9\-_]{6,20})',
+    r'order\s*#\s*([a-zA-Z0-9\-_]{4,20})',
+
+    # Tracking patterns
+    r'tracking\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{6,25})',
+    r'track\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{6,25})',
+
+    # Confirmation patterns
+    r'confirmation\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
+    r'reference\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
+
+    # Purchase patterns
+    r'purchase\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
+    r'transaction\s*(?:id|number)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
+
+    # Hash patterns
+    r'#([a-zA-Z0-9\-_]{6,20})',
+
+    # Patterns below have no keyword context, so they must span a whole
+    # word; otherwise long HTML/base64 runs yield hundreds of fragments
+
+    # Long numeric sequences (common for order IDs)
+    r'\b([0-9]{8,15})\b',
+
+    # Amazon specific patterns
+    r'\b([0-9]{3}-[0-9]{7}-[0-9]{7})\b',  # Standard Amazon format
+    r'\b([A-Z][0-9]{2}-[0-9]{7}-[0-9]{7})\b',  # Amazon with letter prefix
+    r'\b(D[0-9]{2}-[0-9]{7}-[0-9]{7})\b',  # Amazon D01 format
+    r'\b([0-9]{14})\b',  # Amazon 14-digit format
+
+    # Myntra specific patterns
+    r'\b(MYN[0-9]{8,12})\b',  # Myntra order format
+    r'\b([0-9]{10,12})\b',  # Myntra numeric orders
+
+    # Generic patterns with common separators
+    r'\b([A-Z]{2,4}[0-9]{6,12})\b',
+    r'\b([0-9]{6,10}-[0-9]{6,10})\b',
+    r'\b(?=[A-Z]*[0-9])([A-Z0-9]{8,15})\b',  # Must contain a digit, not just a long word
+])
+
+_STATUS_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in [
+    r'(shipped|delivered|out for delivery|in transit|processing|confirmed|cancelled|pending)',
+    r'status:\s*([^<>\n]+)',
+    r'order\s+status:\s*([^<>\n]+)',
+])
+
+_DELIVERY_DATE_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in [
+    r'delivery\s+(?:date|by):\s*([^<>\n]+)',
+    r'expected\s+(?:delivery|arrival):\s*([^<>\n]+)',
+    r'estimated\s+(?:delivery|arrival):\s*([^<>\n]+)',
+    r'will\s+(?:arrive|be delivered)\s+(?:by|on)?\s*([^<>\n]+)',
+])
+
+# Date parsing patterns
+_DATE_PATTERNS = tuple(re.compile(p) for p in [
+    r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
+    r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
+    r'([a-zA-Z]+ \d{1,2}, \d{4})',
+    r'(\d{1,2} [a-zA-Z]+ \d{4})',
+])
+
+_AMAZON_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in [
+    r'order\s*#?\s*([0-9]{3}-[0-9]{7}-[0-9]{7})',  # Standard Amazon
+    r'order\s*#?\s*([A-Z][0-9]{2}-[0-9]{7}-[0-9]{7})',  # Amazon with prefix
+    r'order\s*#?\s*([D][0-9]{2}-[0-9]{7}-[0-9]{7})',  # Amazon D01 format
+    r'\b([0-9]{3}-[0-9]{7}-[0-9]{7})\b',  # Standalone format
+    r'\b([A-Z][0-9]{2}-[0-9]{7}-[0-9]{7})\b',
+    r'\b([D][0-9]{2}-[0-9]{7}-[0-9]{7})\b',
+    r'order\s*#?\s*([0-9]{14})',  # 14-digit Amazon orders
+    r'\b([0-9]{14})\b',  # Standalone 14-digit
+])
+
+_MYNTRA_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in [
+    r'order\s*(?:id|number|#)?\s*:?\s*([0-9]{10,12})',  # Myntra order numbers
+    r'order\s*(?:id|number|#)?\s*:?\s*(MYN[0-9]{8,12})',  # Myntra MYN format
+    r'\b([0-9]{10,12})\b',  # Standalone 10-12 digit numbers
+    r'\b(MYN[0-9]{8,12})\b',  # Standalone MYN format
+])
+
+# Subject keyword -> canonical status, in priority order
+_STATUS_CANONICAL = {
+    'shipped': 'Shipped',
+    'delivered': 'Delivered',
+    'confirmed': 'Confirmed',
+    'processing': 'Processing',
+    'cancelled': 'Cancelled',
+    'dispatched': 'Shipped',
+    'out_for_delivery': 'Out for Delivery',
+}
+_SUBJECT_STATUS_RANK = {name: rank for rank, name in enumerate(_STATUS_CANONICAL)}
+_SUBJECT_STATUS_RE = re.compile(
+    '|'.join(f"(?P<{name}>{name.replace('_', ' ')})" for name in _STATUS_CANONICAL),
+    re.IGNORECASE
+)
+
+# Any sequence that looks like an identifier (case-sensitive on purpose)
+_FALLBACK_ID_PATTERNS = tuple(re.compile(p) for p in [
+    r'\b(?=[A-Z]*[0-9])([A-Z0-9]{6,})\b',  # Any uppercase/number combo with a digit
+    r'\b([0-9]{6,})\b',     # Any 6+ digit number
+    r'\b([A-Z]{2,}[0-9]{3,})\b',  # Letters followed by numbers
+    r'\b([0-9]{3,}[A-Z]{2,})\b',  # Numbers followed by letters
+])
+
+# IDs sit near the top of an email; never scan further than this into a text
+_MAX_SCAN_CHARS = 50000
+
+# Default cap on the body length the parser works on
+_MAX_BODY_CHARS = 16 * 1024
+
+def _context_spans(text: str, regex, radius: int) -> List[Tuple[int, int]]:
+    """(start, end) ranges within radius chars of a regex match, overlapping ranges merged"""
+    spans = []
+    for m in regex.finditer(text):
+        lo, hi = max(0, m.start() - radius), m.end() + radius
+        if spans and lo <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], hi)
+        else:
+            spans.append((lo, hi))
+    return spans
+
+def _overlaps_any(start: int, end: int, spans: List[Tuple[int, int]], span_ends: List[int]) -> bool:
+    """Whether [start, end) overlaps one of the sorted, disjoint spans"""
+    i = bisect_right(span_ends, start)
+    return i < len(spans) and spans[i][0] < end
+
+# Generic dates are only considered this close to delivery wording
+_DELIVERY_CONTEXT_RE = re.compile(r'deliver|arriv|ship|dispatch', re.IGNORECASE)
+_DELIVERY_CONTEXT_RADIUS = 40
+
+_ORDER_ID_STOPWORDS = frozenset(['order', 'number', 'confirmation', 'tracking', 'purchase'])
+
+# An order email's subject mentions at least one of these; anything else is
+# rejected with plain substring checks before any regex or HTML work
+_MUST_HAVE_TOKENS = ('order', 'ship', 'deliver', 'tracking', 'receipt', 'purchase', 'dispatch', 'invoice')
+_MUST_HAVE_RE = re.compile('|'.join(_MUST_HAVE_TOKENS))
+
+# Strong indicators of actual order confirmations
+_ORDER_CONFIRMATION_KEYWORDS = (
+    'order confirmation', 'purchase confirmation', 'your order',
+    'order number', 'tracking number', 'shipment confirmation',
+    'delivery confirmation', 'order receipt', 'thank you for your order',
+    'order placed', 'order summary', 'order details'
+)
+
+# Promotional/marketing indicators to exclude
+_PROMOTIONAL_KEYWORDS = (
+    'unsubscribe', 'promotional', 'sale', 'deal', 'offer', 
+    'discount', 'newsletter', 'marketing', 'advertisement',
+    'limited time', 'save now', 'special offer', 'free shipping',
+    'browse our', 'check out our', 'new arrivals'
+)
+
+# Keyword checks run against lowercased text, so no IGNORECASE needed
+_ORDER_KW_RE = re.compile('|'.join(map(re.escape, _ORDER_CONFIRMATION_KEYWORDS)))
+_PROMO_KW_RE = re.compile('|'.join(map(re.escape, _PROMOTIONAL_KEYWORDS)))
+
+_ORDER_NUM_RE = re.compile(r'order\s*(?:#|number|id)?\s*:?\s*[a-zA-Z0-9\-_]{4,}')
+_TRACKING_NUM_RE = re.compile(r'tracking\s*(?:number|id)?\s*:?\s*[a-zA-Z0-9\-_]{6,}')
+
+_NAME_RE = re.compile(r'^([^<]+)')
+_EMAIL_RE = re.compile(r'<([^@]+@([^>]+))>')
+_DOMAIN_PREFIX_RE = re.compile(r'^(www\.|mail\.|noreply\.|no-reply\.)')
+_DOMAIN_SUFFIX_RE = re.compile(r'\.(com|org|net|co\.uk|in)$')
+_SUBJECT_HASH_ID_RE = re.compile(r'#([A-Z0-9\-_]{4,})')
+_SUBJECT_NUMBER_RE = re.compile(r'([0-9]{4,})')
+_SENDER_DOMAIN_RE = re.compile(r'@([^>\s]+)')
+_DATE_CLEAN_RE = re.compile(r'[^\w\s\-/,:]')
+
+# Common date formats, grouped by the shape of string they can parse
+_DATE_FORMAT_PROBES = (
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{4}'), ('%m/%d/%Y', '%d/%m/%Y')),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}'), ('%Y-%m-%d',)),
+    (re.compile(r'\d{1,2}-\d{1,2}-\d{4}'), ('%m-%d-%Y', '%d-%m-%Y')),
+    (re.compile(r'[A-Za-z]+\s+\d{1,2},\s+\d{4}'), ('%B %d, %Y', '%b %d, %Y')),
+    (re.compile(r'\d{1,2}\s+[A-Za-z]+\s+\d{4}'), ('%d %B %Y', '%d %b %Y')),
+    (re.compile(r'\d{4}/\d{1,2}/\d{1,2}'), ('%Y/%m/%d',)),
+)
+
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+# Horizontal whitespace only: several patterns rely on newlines to end a value
+_WS_RE = re.compile(r'[ \t\r\f\v]+')
+
+def _strip_html(text: str) -> str:
+    """Cheap HTML-to-text for the common case; BeautifulSoup only when scripts/styles need dropping"""
+    lowered = text.lower()
+    if '<script' in lowered or '<style' in lowered:
+        return BeautifulSoup(text, 'html.parser').get_text()
+    return html.unescape(_WS_RE.sub(' ', _HTML_TAG_RE.sub(' ', text)))
 
 class OrderEmailParser:
     """Parser for extracting order information from emails"""
     
-    def __init__(self):
-        # Common order-related patterns
+    def __init__(self, max_body_chars: int = _MAX_BODY_CHARS):
+        # Bodies are cut to this length before any regex or HTML work
+        self.max_body_chars = max_body_chars
+        
+        # Patterns live at module level so they are compiled once per process
         self.order_patterns = {
-            'order_id': [
-                # Order number patterns
-                r'order\s*(?:#|number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
-                r'order\s+([a-zA-Z0-9\-_]{6,20})',
-                r'order\s*#\s*([a-zA-Z0-9\-_]{4,20})',
-                
-                # Tracking patterns
-                r'tracking\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{6,25})',
-                r'track\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{6,25})',
-                
-                # Confirmation patterns
-                r'confirmation\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
-                r'reference\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
-                
-                # Purchase patterns
-                r'purchase\s*(?:number|id)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
-                r'transaction\s*(?:id|number)?\s*:?\s*([a-zA-Z0-9\-_]{4,20})',
-                
-                # Hash patterns
-                r'#([a-zA-Z0-9\-_]{6,20})',
-                
-                # Long numeric sequences (common for order IDs)
-                r'([0-9]{8,15})',
-                
-                # Amazon specific patterns
-                r'([0-9]{3}-[0-9]{7}-[0-9]{7})',  # Standard Amazon format
-                r'([A-Z][0-9]{2}-[0-9]{7}-[0-9]{7})',  # Amazon with letter prefix
-                r'(D[0-9]{2}-[0-9]{7}-[0-9]{7})',  # Amazon D01 format
-                r'([0-9]{14})',  # Amazon 14-digit format
-                
-                # Myntra specific patterns
-                r'(MYN[0-9]{8,12})',  # Myntra order format
-                r'([0-9]{10,12})',  # Myntra numeric orders
-                
-                # Generic patterns with common separators
-                r'([A-Z]{2,4}[0-9]{6,12})',
-                r'([0-9]{6,10}-[0-9]{6,10})',
-                r'([A-Z0-9]{8,15})',
-            ],
-            'status': [
-                r'(shipped|delivered|out for delivery|in transit|processing|confirmed|cancelled|pending)',
-                r'status:\s*([^<>\n]+)',
-                r'order\s+status:\s*([^<>\n]+)',
-            ],
-            'delivery_date': [
-                r'delivery\s+(?:date|by):\s*([^<>\n]+)',
-                r'expected\s+(?:delivery|arrival):\s*([^<>\n]+)',
-                r'estimated\s+(?:delivery|arrival):\s*([^<>\n]+)',
-                r'will\s+(?:arrive|be delivered)\s+(?:by|on)?\s*([^<>\n]+)',
-            ]
+            'order_id': _ORDER_ID_PATTERNS,
+            'status': _STATUS_PATTERNS,
+            'delivery_date': _DELIVERY_DATE_PATTERNS,
         }
-        
-        # Common seller identifiers
-        self.seller_patterns = [
-            r'from\s+(.+?)(?:\s+<|$)',
-            r'@([a-zA-Z0-9\-_.]+)',
-        ]
-        
-        # Date parsing patterns
-        self.date_patterns = [
-            r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
-            r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
-            r'([a-zA-Z]+ \d{1,2}, \d{4})',
-            r'(\d{1,2} [a-zA-Z]+ \d{4})',
+    
+    def prefilter(self, emails: List[Dict]) -> List[Optional[bool]]:
+        """Vectorized subject/sender phase of _is_order_email over a whole batch
+        
+        Returns True or False where subject and sender settle the question,
+        and None where the body still has to be checked.
+        """
+        if not emails:
+            return []
+        
+        df = pd.DataFrame(emails, columns=['subject', 'sender'])
+        subject = df['subject'].fillna('').str.lower()
+        sender = df['sender'].fillna('').str.lower()
+        
+        has_numbers = (
+            subject.str.contains(_ORDER_NUM_RE) | subject.str.contains(_TRACKING_NUM_RE) |
+            sender.str.contains(_ORDER_NUM_RE) | sender.str.contains(_TRACKING_NUM_RE)
+        )
+        is_promotional = subject.str.contains(_PROMO_KW_RE)
+        has_tokens = subject.str.contains(_MUST_HAVE_RE)
+        
+        return [
+            False if not tokens else (True if numbers else (False if promotional else None))
+            for tokens, numbers, promotional in zip(
+                has_tokens.tolist(), has_numbers.tolist(), is_promotional.tolist()
+            )
         ]
     
-    def parse_email(self, email_data: Dict) -> Optional[Dict]:
-        """Parse an email for order information"""
-        try:
-            # Check if email is order-related
-            if not self._is_order_email(email_data):
-                # Debug: Log why email was rejected
-                subject = email_data.get('subject', '')[:100]
-                return None
-            
-            # Extract information
-            seller = self._extract_seller(email_data)
-            order_id = self._extract_order_id(email_data)
-            status = self._extract_status(email_data)
-            delivery_date = self._extract_delivery_date(email_data)
-            
-            # Generate order ID if none found using email metadata
-            if not order_id:
-                email_date = email_data.get('date', datetime.now())
-                subject = email_data.get('subject', '')[:20].replace(' ', '')
-                date_str = email_date.strftime('%Y%m%d') if hasattr(email_date, 'strftime') else '20240101'
-                order_id = f"ORD-{date_str}-{abs(hash(subject)) % 10000:04d}"
-            
-            # Return order if we have meaningful information
-            # Must have either seller info or identifiable order content
-            has_seller = seller and seller != 'Unknown'
-            has_status = status and status.lower() not in ['', 'unknown']
-            
-            if has_seller or has_status or order_id:
-                return {
-                    'seller': seller or 'Unknown',
-                    'order_id': order_id,
-                    'status': status or 'Confirmed',
-                    'delivery_date': delivery_date,
-                    'email_subject': email_data.get('subject', ''),
-                    'email_date': email_data.get('date', datetime.now())
-                }
-            
+    def fill_missing_order_ids(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Generate ORD-<date>-<hash> IDs for orders where none was extracted
+        
+        Works on the whole orders frame at once; the hash is SipHash from
+        pandas, so IDs are stable across runs.
+        """
+        missing = df['order_id'].isna()
+        if not missing.any():
+            return df
+        
+        rows = df[missing]
+        date_str = (
+            pd.to_datetime(rows['email_date'], utc=True, errors='coerce')
+            .dt.strftime('%Y%m%d')
+            .fillna('20240101')
+        )
+        subject = rows['email_subject'].fillna('').str[:20].str.replace(' ', '', regex=False)
+        suffix = (pd.util.hash_pandas_object(subject, index=False) % 10000).astype(str).str.zfill(4)
+        df.loc[missing, 'order_id'] = 'ORD-' + date_str + '-' + suffix
+        return df
+    
+    def parse_email(self, email_data: Dict, is_order: Optional[bool] = None) -> Optional[Dict]:
+        """Parse an email for order information
+        
+        is_order may carry a decision already made by prefilter(), which
+        skips the per-email order check. Errors propagate to the caller,
+        which may be a worker thread with no business rendering them.
+        """
+        # Rejected on subject and sender alone; the body is never needed
+        if is_order is False:
             return None
-            
-        except Exception as e:
-            st.warning(f"Error parsing email: {str(e)}")
+        
+        # Order details sit near the top; bound the work on huge bodies
+        full_email = email_data
+        body = email_data.get('body', '') or ''
+        if len(body) > self.max_body_chars:
+            email_data = {**email_data, 'body': body[:self.max_body_chars]}
+        
+        # Check if email is order-related
+        if is_order is None:
+            is_order = self._is_order_email(email_data)
+        if not is_order:
+            # Debug: Log why email was rejected
+            subject = email_data.get('subject', '')[:100]
             return None
+        
+        # Extract information
+        seller = self._extract_seller(email_data)
+        order_id = self._extract_order_id(email_data, full_email)
+        status = self._extract_status(email_data)
+        delivery_date = self._extract_delivery_date(email_data)
+        
+        # order_id may be None here; fill_missing_order_ids() generates
+        # fallback IDs for the whole batch afterwards
+        return {
+            'seller': seller or 'Unknown',
+            'order_id': order_id,
+            'status': status or 'Confirmed',
+            'delivery_date': delivery_date,
+            'email_subject': email_data.get('subject', ''),
+            'email_date': email_data.get('date', datetime.now())
+        }
     
     def _is_order_email(self, email_data: Dict) -> bool:
         """Check if email is an actual order confirmation (not promotional)"""
         subject = email_data.get('subject', '').lower()
-        body = email_data.get('body', '').lower()
+        if not any(token in subject for token in _MUST_HAVE_TOKENS):
+            return False
         sender = email_data.get('sender', '').lower()
         
-        # Strong indicators of actual order confirmations
-        order_confirmation_keywords = [
-            'order confirmation', 'purchase confirmation', 'your order',
-            'order number', 'tracking number', 'shipment confirmation',
-            'delivery confirmation', 'order receipt', 'thank you for your order',
-            'order placed', 'order summary', 'order details'
-        ]
-        
-        # Promotional/marketing indicators to exclude
-        promotional_keywords = [
-            'unsubscribe', 'promotional', 'sale', 'deal', 'offer', 
-            'discount', 'newsletter', 'marketing', 'advertisement',
-            'limited time', 'save now', 'special offer', 'free shipping',
-            'browse our', 'check out our', 'new arrivals'
-        ]
-        
-        text_to_check = f"{subject} {body} {sender}"
+        # Phase 1: subject and sender only, which settles most emails
+        # Actual order/tracking numbers are conclusive on their own
+        if any(_ORDER_NUM_RE.search(part) or _TRACKING_NUM_RE.search(part) for part in (subject, sender)):
+            return True
         
-        # Must have order confirmation keywords
-        has_order_keywords = any(keyword in text_to_check for keyword in order_confirmation_keywords)
+        # A promotional subject without an order number is not an order
+        if _PROMO_KW_RE.search(subject):
+            return False
         
-        # Must not have promotional keywords
-        has_promotional = any(keyword in text_to_check for keyword in promotional_keywords)
+        # Phase 2: inconclusive, so fall back to the (much larger) body
+        body = self._body_lower(email_data)
+        if _ORDER_NUM_RE.search(body) or _TRACKING_NUM_RE.search(body):
+            return True
         
-        # Additional check: look for actual order/tracking numbers
-        has_order_numbers = bool(re.search(r'order\s*(?:#|number|id)?\s*:?\s*[a-zA-Z0-9\-_]{4,}', text_to_check))
-        has_tracking_numbers = bool(re.search(r'tracking\s*(?:number|id)?\s*:?\s*[a-zA-Z0-9\-_]{6,}', text_to_check))
-        
-        # Return true only if it looks like a real order confirmation
-        return (has_order_keywords and not has_promotional) or has_order_numbers or has_tracking_numbers
+        # Otherwise must have order confirmation keywords and no promotional ones
+        if not any(_ORDER_KW_RE.search(part) for part in (subject, sender, body)):
+            return False
+        return not (_PROMO_KW_RE.search(sender) or _PROMO_KW_RE.search(body))
+    
+    def _body_lower(self, email_data: Dict) -> str:
+        """Lowercased email body, computed once and cached on the email dict"""
+        body_lower = email_data.get('_body_lower')
+        if body_lower is None:
+            body_lower = email_data.get('body', '').lower()
+            email_data['_body_lower'] = body_lower
+        return body_lower
+    
+    def _plain_text(self, email_data: Dict) -> str:
+        """Subject and body with HTML stripped, computed once and cached on the email dict"""
+        text = email_data.get('_text')
+        if text is None:
+            text = f"{email_data.get('subject', '')} {email_data.get('body', '')}"
+            
+            # Clean HTML if present
+            if '<' in text and '>' in text:
+                text = _strip_html(text)
+            email_data['_text'] = text
+        return text
     
     def _extract_seller(self, email_data: Dict) -> str:
         """Extract seller information from email"""
@@ -164,14 +356,14 @@ class OrderEmailParser:
         # Clean up sender email
         if '<' in sender and '>' in sender:
             # Extract name before email
-            name_match = re.search(r'^([^<]+)', sender)
+            name_match = _NAME_RE.search(sender)
             if name_match:
                 seller_name = name_match.group(1).strip().strip('"')
                 if seller_name and not seller_name.startswith('=?'):
                     return seller_name
             
             # Extract domain from email
-            email_match = re.search(r'<([^@]+@([^>]+))>', sender)
+            email_match = _EMAIL_RE.search(sender)
             if email_match:
                 domain = email_match.group(2)
                 return self._clean_domain(domain)
@@ -186,61 +378,45 @@ class OrderEmailParser:
     def _clean_domain(self, domain: str) -> str:
         """Clean and format domain name"""
         # Remove common prefixes and suffixes
-        domain = re.sub(r'^(www\.|mail\.|noreply\.|no-reply\.)', '', domain)
-        domain = re.sub(r'\.(com|org|net|co\.uk|in)$', '', domain)
+        domain = _DOMAIN_PREFIX_RE.sub('', domain)
+        domain = _DOMAIN_SUFFIX_RE.sub('', domain)
         
         # Capitalize first letter
         return domain.title() if domain else 'Unknown'
     
-    def _extract_order_id(self, email_data: Dict) -> Optional[str]:
-        """Extract order ID from email with comprehensive fallback methods"""
+    def _extract_order_id(self, email_data: Dict, full_email: Optional[Dict] = None) -> Optional[str]:
+        """Extract order ID from email with comprehensive fallback methods
+        
+        When email_data is a truncated copy, full_email is searched for a
+        real ID before falling back to guesses or a generated ID.
+        """
         subject = email_data.get('subject', '')
-        body = email_data.get('body', '')
         sender = email_data.get('sender', '').lower()
-        text = f"{subject} {body}"
         
-        # Clean HTML if present
-        if '<' in text and '>' in text:
-            soup = BeautifulSoup(text, 'html.parser')
-            text = soup.get_text()
+        sources = [email_data] if full_email is None or full_email is email_data else [email_data, full_email]
+        for source in sources:
+            text = self._plain_text(source)
+            order_id = self._match_order_id(text, sender)
+            if order_id:
+                return order_id
         
-        # Retailer-specific extraction
-        if 'amazon' in sender:
-            return self._extract_amazon_order_id(text)
-        elif 'myntra' in sender:
-            return self._extract_myntra_order_id(text)
-        
-        # Try primary patterns first
-        for pattern in self.order_patterns['order_id']:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                # Filter out common false positives
-                if (len(match) >= 4 and 
-                    not match.lower() in ['order', 'number', 'confirmation', 'tracking', 'purchase'] and
-                    (not match.isdigit() or len(match) >= 8)):  # Allow long numeric sequences
-                    return match.strip()
+        # Retailer-specific extraction has no fallbacks
+        if 'amazon' in sender or 'myntra' in sender:
+            return None
         
         # Fallback 1: Look for any sequence that looks like an identifier
-        fallback_patterns = [
-            r'([A-Z0-9]{6,})',  # Any uppercase/number combo
-            r'([0-9]{6,})',     # Any 6+ digit number
-            r'([A-Z]{2,}[0-9]{3,})',  # Letters followed by numbers
-            r'([0-9]{3,}[A-Z]{2,})',  # Numbers followed by letters
-        ]
-        
-        for pattern in fallback_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                if len(match) >= 6:
-                    return match.strip()
+        for pattern in _FALLBACK_ID_PATTERNS:
+            for m in pattern.finditer(text, 0, _MAX_SCAN_CHARS):
+                if len(m.group(1)) >= 6:
+                    return m.group(1).strip()
         
         # Fallback 2: Extract from subject line specifically
-        subject_match = re.search(r'#([A-Z0-9\-_]{4,})', subject)
+        subject_match = _SUBJECT_HASH_ID_RE.search(subject)
         if subject_match:
             return subject_match.group(1)
         
         # Fallback 3: Look for numbers in subject
-        subject_numbers = re.findall(r'([0-9]{4,})', subject)
+        subject_numbers = _SUBJECT_NUMBER_RE.findall(subject)
         if subject_numbers:
             return subject_numbers[0]
         
@@ -249,7 +425,7 @@ class OrderEmailParser:
         email_date = email_data.get('date')
         if sender and email_date:
             # Extract domain
-            domain_match = re.search(r'@([^>\s]+)', sender)
+            domain_match = _SENDER_DOMAIN_RE.search(sender)
             if domain_match:
                 domain = domain_match.group(1).split('.')[0].upper()[:4]
                 date_str = email_date.strftime('%m%d') if hasattr(email_date, 'strftime') else '0000'
@@ -257,102 +433,95 @@ class OrderEmailParser:
         
         return None
     
+    def _match_order_id(self, text: str, sender: str) -> Optional[str]:
+        """Order ID actually present in text, from retailer or primary patterns"""
+        # Retailer-specific extraction
+        if 'amazon' in sender:
+            return self._extract_amazon_order_id(text)
+        elif 'myntra' in sender:
+            return self._extract_myntra_order_id(text)
+        
+        # Try primary patterns first, each over the whole text in declaration
+        # order. Not fused into one alternation: its non-overlapping matches
+        # let a lower-priority pattern consume text a higher one needs, e.g.
+        # "purchase order A1B2" would yield "order" (rejected) and hide A1B2
+        for pattern in _ORDER_ID_PATTERNS:
+            for m in pattern.finditer(text, 0, _MAX_SCAN_CHARS):
+                match = m.group(1)
+                # Filter out common false positives
+                if (len(match) >= 4 and 
+                    match.lower() not in _ORDER_ID_STOPWORDS and
+                    (not match.isdigit() or len(match) >= 8)):  # Allow long numeric sequences
+                    return match.strip()
+        return None
+    
     def _extract_amazon_order_id(self, text: str) -> Optional[str]:
         """Extract Amazon-specific order IDs"""
-        amazon_patterns = [
-            r'order\s*#?\s*([0-9]{3}-[0-9]{7}-[0-9]{7})',  # Standard Amazon
-            r'order\s*#?\s*([A-Z][0-9]{2}-[0-9]{7}-[0-9]{7})',  # Amazon with prefix
-            r'order\s*#?\s*([D][0-9]{2}-[0-9]{7}-[0-9]{7})',  # Amazon D01 format
-            r'([0-9]{3}-[0-9]{7}-[0-9]{7})',  # Standalone format
-            r'([A-Z][0-9]{2}-[0-9]{7}-[0-9]{7})',
-            r'([D][0-9]{2}-[0-9]{7}-[0-9]{7})',
-            r'order\s*#?\s*([0-9]{14})',  # 14-digit Amazon orders
-            r'([0-9]{14})',  # Standalone 14-digit
-        ]
-        
-        for pattern in amazon_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                return matches[0].strip()
+        for pattern in _AMAZON_PATTERNS:
+            m = pattern.search(text, 0, _MAX_SCAN_CHARS)
+            if m:
+                return m.group(1).strip()
         return None
     
     def _extract_myntra_order_id(self, text: str) -> Optional[str]:
         """Extract Myntra-specific order IDs"""
-        myntra_patterns = [
-            r'order\s*(?:id|number|#)?\s*:?\s*([0-9]{10,12})',  # Myntra order numbers
-            r'order\s*(?:id|number|#)?\s*:?\s*(MYN[0-9]{8,12})',  # Myntra MYN format
-            r'([0-9]{10,12})',  # Standalone 10-12 digit numbers
-            r'(MYN[0-9]{8,12})',  # Standalone MYN format
-        ]
-        
-        for pattern in myntra_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
+        for pattern in _MYNTRA_PATTERNS:
+            m = pattern.search(text, 0, _MAX_SCAN_CHARS)
+            if m:
                 # Validate it's likely a Myntra order (10+ digits)
-                order_id = matches[0].strip()
+                order_id = m.group(1).strip()
                 if len(order_id) >= 10:
                     return order_id
         return None
     
     def _extract_status(self, email_data: Dict) -> Optional[str]:
         """Extract order status from email"""
-        text = f"{email_data.get('subject', '')} {email_data.get('body', '')}"
-        
-        # Clean HTML if present
-        if '<' in text and '>' in text:
-            soup = BeautifulSoup(text, 'html.parser')
-            text = soup.get_text()
+        text = self._plain_text(email_data)
         
         # Try each pattern
         for pattern in self.order_patterns['status']:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+            matches = pattern.findall(text)
             if matches:
                 status = matches[0].strip()
                 if isinstance(status, tuple):
                     status = status[0]
                 return status.title()
         
-        # Check subject for status keywords
-        subject = email_data.get('subject', '').lower()
-        status_keywords = {
-            'shipped': 'Shipped',
-            'delivered': 'Delivered',
-            'confirmed': 'Confirmed',
-            'processing': 'Processing',
-            'cancelled': 'Cancelled',
-            'dispatched': 'Shipped',
-            'out for delivery': 'Out for Delivery'
-        }
-        
-        for keyword, status in status_keywords.items():
-            if keyword in subject:
-                return status
-        
-        return None
+        # Check subject for status keywords; earlier-listed keywords win
+        best = None
+        for m in _SUBJECT_STATUS_RE.finditer(email_data.get('subject', '')):
+            rank = _SUBJECT_STATUS_RANK[m.lastgroup]
+            if best is None or rank < _SUBJECT_STATUS_RANK[best]:
+                best = m.lastgroup
+        return _STATUS_CANONICAL[best] if best else None
     
     def _extract_delivery_date(self, email_data: Dict) -> Optional[datetime]:
         """Extract delivery date from email"""
-        text = f"{email_data.get('subject', '')} {email_data.get('body', '')}"
-        
-        # Clean HTML if present
-        if '<' in text and '>' in text:
-            soup = BeautifulSoup(text, 'html.parser')
-            text = soup.get_text()
+        text = self._plain_text(email_data)
         
         # Try delivery date patterns
         for pattern in self.order_patterns['delivery_date']:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+            matches = pattern.findall(text)
             for match in matches:
                 date_str = match.strip()
                 parsed_date = self._parse_date_string(date_str)
                 if parsed_date:
                     return parsed_date
         
-        # Look for any dates in the email
-        for pattern in self.date_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                parsed_date = self._parse_date_string(match)
+        # Look for any dates near delivery wording; scanning every date in a
+        # long body means dozens of strptime attempts for nothing. Dates are
+        # matched on the full text and kept if they touch a context span, as
+        # matching inside a sliced window could cut "12/25" down to "2/25"
+        spans = _context_spans(text, _DELIVERY_CONTEXT_RE, _DELIVERY_CONTEXT_RADIUS)
+        if not spans:
+            return None
+        span_ends = [end for _, end in spans]
+        
+        for pattern in _DATE_PATTERNS:
+            for m in pattern.finditer(text, 0, _MAX_SCAN_CHARS):
+                if not _overlaps_any(m.start(1), m.end(1), spans, span_ends):
+                    continue
+                parsed_date = self._parse_date_string(m.group(1))
                 if parsed_date and parsed_date > datetime.now():
                     return parsed_date
         
@@ -364,27 +533,18 @@ class OrderEmailParser:
             return None
         
         # Clean the date string
-        date_str = re.sub(r'[^\w\s\-/,:]', '', date_str).strip()
-        
-        # Common date formats to try
-        formats = [
-            '%m/%d/%Y',
-            '%d/%m/%Y',
-            '%Y-%m-%d',
-            '%m-%d-%Y',
-            '%d-%m-%Y',
-            '%B %d, %Y',
-            '%b %d, %Y',
-            '%d %B %Y',
-            '%d %b %Y',
-            '%Y/%m/%d',
-        ]
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                continue
+        date_str = _DATE_CLEAN_RE.sub('', date_str).strip()
+        
+        # Only try the formats whose shape matches; an impossible date
+        # (e.g. month 13) still falls through to the next candidate
+        for probe, formats in _DATE_FORMAT_PROBES:
+            if probe.fullmatch(date_str):
+                for fmt in formats:
+                    try:
+                        return datetime.strptime(date_str, fmt)
+                    except ValueError:
+                        continue
+                break
         
         # Try to parse relative dates
         today = datetime.now()
@@ -1,24 +1,197 @@
 import os
-import pickle
+import re
+import json
+import hashlib
+import time
+import random
+import sqlite3
 import base64
 import email
+import email.policy
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
+from itertools import chain
 from datetime import datetime, timezone
-from typing import List, Dict, Optional
+from email.message import EmailMessage
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+import httplib2
+import google_auth_httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from email_parser import _MUST_HAVE_TOKENS
+
+# Subjects worth downloading in full: built from the same tokens
+# OrderEmailParser requires before it looks at an email at all
+_ORDER_SUBJECT_RE = re.compile('|'.join(map(re.escape, _MUST_HAVE_TOKENS)), re.IGNORECASE)
+
+# Gmail search negations that exclude promotional mail
+_EXCLUDE_TERMS = (
+    "-unsubscribe",
+    "-promotional",
+    "-sale",
+    "-deal",
+    "-offer",
+    "-discount",
+    "-newsletter",
+)
+
+# Date-independent part of the order search. Gmail already sorts receipts,
+# order and shipping updates into the Purchases category, so one indexed
+# lookup replaces matching a list of order phrases against every message
+_ORDER_CLAUSE = 'category:purchases ' + ' '.join(_EXCLUDE_TERMS)
+
+# Lowercased names of the only headers _parse_message reads
+_WANTED_HEADERS = frozenset(('subject', 'from', 'date'))
+
+# Seconds before a stalled Gmail API connection is given up on
+_HTTP_TIMEOUT = 30
+
+# 403 responses with these reasons are quota errors, not permission errors
+_RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+# Connection-level failures (timeouts, resets, broken responses); the
+# request never got an answer, so it can simply be sent again
+_TRANSPORT_ERRORS = (httplib2.HttpLib2Error, OSError)
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a Gmail API error is a rate-limit rejection, server error or transport failure worth retrying"""
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return True
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429 or error.resp.status >= 500:
+        return True
+    content = error.content.decode('utf-8', 'ignore') if isinstance(error.content, bytes) else str(error.content)
+    return error.resp.status == 403 and any(reason in content for reason in _RATE_LIMIT_REASONS)
+
+def _extract_body(eml: EmailMessage) -> str:
+    """Extract email body from a parsed message, preferring plain text over HTML"""
+    part = eml.get_body(preferencelist=('plain', 'html'))
+    if part is None:
+        return ''
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        # Unknown or wrong charset declared; fall back to lenient UTF-8
+        return (part.get_payload(decode=True) or b'').decode('utf-8', 'replace')
+
+def _authorized_http(creds: Credentials) -> google_auth_httplib2.AuthorizedHttp:
+    """Keep-alive HTTP connection that signs requests with creds
+    
+    httplib2.Http is not thread-safe, so each thread needs its own.
+    """
+    return google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=_HTTP_TIMEOUT))
+
+def _build_service(creds: Credentials):
+    """Gmail service on its own connection
+    
+    Not shared process-wide: each holds an httplib2.Http, which is not
+    thread-safe, and every Streamlit session runs on its own thread. The
+    library's bundled discovery document is used, so building one is a
+    few milliseconds with nothing fetched over HTTP.
+    """
+    return build('gmail', 'v1', http=_authorized_http(creds), cache_discovery=False, static_discovery=True)
+
+class MessageCache:
+    """On-disk cache of one account's parsed messages keyed by Gmail message ID
+    
+    Gmail messages are immutable once sent, so entries never expire. Rows
+    are stored as JSON rather than pickle so the file cannot carry code.
+    Only the extracted body text is stored, never attachments. Messages
+    whose subject ruled them out after the metadata pass are stored with a
+    None body, so reruns skip them without a fetch.
+    """
+    
+    DEFAULT_DIR = '.cache'
+    
+    # Stay under SQLite's bound-parameter limit in IN (...) lookups
+    _LOOKUP_CHUNK = 500
+    
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS messages (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+    
+    @classmethod
+    def for_account(cls, email_address: str, directory: str = DEFAULT_DIR) -> 'MessageCache':
+        """Cache file of its own for one Gmail account
+        
+        Named by a hash of the address, so accounts sharing a deployment
+        never read each other's mail and the address is not on disk in clear.
+        """
+        digest = hashlib.sha256(email_address.strip().lower().encode('utf-8')).hexdigest()[:16]
+        return cls(os.path.join(directory, f'gmail_messages_{digest}.sqlite3'))
+    
+    def clear(self):
+        """Delete the cache file and everything in it"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def get_many(self, message_ids: List[str]) -> Dict[str, Dict]:
+        """Cached emails for whichever of message_ids are present"""
+        found = {}
+        with closing(sqlite3.connect(self.path)) as conn:
+            for start in range(0, len(message_ids), self._LOOKUP_CHUNK):
+                chunk = message_ids[start:start + self._LOOKUP_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f'SELECT id, data FROM messages WHERE id IN ({placeholders})', chunk)
+                for message_id, data in rows:
+                    email_data = json.loads(data)
+                    email_data['date'] = datetime.fromisoformat(email_data['date'])
+                    found[message_id] = email_data
+        return found
+    
+    def set_many(self, emails: List[Dict]):
+        """Store parsed emails, replacing any existing entries"""
+        rows = [
+            (email_data['id'], json.dumps({**email_data, 'date': email_data['date'].isoformat()}))
+            for email_data in emails
+        ]
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO messages (id, data) VALUES (?, ?)', rows)
 
 class GmailClient:
     """Gmail API client for fetching and processing emails"""
     
     SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
     
-    def __init__(self):
+    # Saved OAuth credentials; older versions pickled them instead
+    TOKEN_FILE = 'token.json'
+    LEGACY_TOKEN_FILE = 'token.pickle'
+    
+    # Batch requests in flight at once, and retries for rate-limited or
+    # failed messages and message listings
+    MAX_FETCH_WORKERS = 4
+    FETCH_RETRIES = 4
+    LIST_RETRIES = 5
+    
+    # Largest page messages.list will return
+    LIST_PAGE_SIZE = 500
+    
+    # Headers requested for the cheap first pass over candidate messages
+    METADATA_HEADERS = ['Subject', 'From', 'Date']
+    
+    def __init__(self, batch_size: int = 50, cache_dir: Optional[str] = MessageCache.DEFAULT_DIR):
         self.service = None
         self.credentials = None
+        # Parsed messages persisted between sessions, one file per account
+        # and opened on first fetch; None disables it
+        self.cache_dir = cache_dir
+        self.cache = None
+        # Messages fetched per batch HTTP call; Gmail allows up to 100, but
+        # smaller batches are less likely to hit per-user rate limits
+        self.batch_size = batch_size
+        self._local = threading.local()
     
     def authenticate(self) -> bool:
         """Authenticate with Gmail API using OAuth2 flow"""
@@ -26,9 +199,9 @@ class GmailClient:
             creds = None
             
             # Check if token file exists
-            if os.path.exists('token.pickle'):
-                with open('token.pickle', 'rb') as token:
-                    creds = pickle.load(token)
+            self._migrate_legacy_token()
+            if os.path.exists(self.TOKEN_FILE):
+                creds = Credentials.from_authorized_user_file(self.TOKEN_FILE, self.SCOPES)
             
             # If there are no (valid) credentials available, let the user log in
             if not creds or not creds.valid:
@@ -70,12 +243,12 @@ class GmailClient:
                             creds = flow.credentials
                             
                             # Save the credentials for the next run
-                            with open('token.pickle', 'wb') as token:
-                                pickle.dump(creds, token)
+                            with open(self.TOKEN_FILE, 'w') as token:
+                                token.write(creds.to_json())
                             
                             # Set up the service immediately
                             self.credentials = creds
-                            self.service = build('gmail', 'v1', credentials=creds)
+                            self.service = _build_service(creds)
                             
                             st.success("✅ Authentication successful!")
                             # Clear the auth code and auth state
@@ -93,189 +266,355 @@ class GmailClient:
                         return False
             
             self.credentials = creds
-            self.service = build('gmail', 'v1', credentials=creds)
+            self.service = _build_service(creds)
             return True
             
         except Exception as e:
             st.error(f"Authentication failed: {str(e)}")
             return False
     
+    def _migrate_legacy_token(self):
+        """Convert a token.pickle left by older versions into token.json, once"""
+        if not os.path.exists(self.LEGACY_TOKEN_FILE) or os.path.exists(self.TOKEN_FILE):
+            return
+        
+        import pickle
+        with open(self.LEGACY_TOKEN_FILE, 'rb') as token:
+            creds = pickle.load(token)
+        with open(self.TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+        os.remove(self.LEGACY_TOKEN_FILE)
+    
     def get_emails(self, start_date: datetime, end_date: datetime, max_results: int = 200) -> List[Dict]:
         """Fetch emails from Gmail within the specified date range"""
         if not self.service:
             raise Exception("Gmail service not authenticated")
         
         try:
-            # Start with a very broad search to ensure we can access emails
+            self._open_cache()
+            
             start_date_str = start_date.strftime('%Y/%m/%d')
             end_date_str = end_date.strftime('%Y/%m/%d')
             
-            # Try a simple date-based query first to test Gmail access
-            simple_query = f"after:{start_date_str} before:{end_date_str}"
-            st.info(f"🔍 Testing Gmail access with simple query: {simple_query}")
-            
-            # Search for messages with simple query first
-            try:
-                result = self.service.users().messages().list(
-                    userId='me',
-                    q=simple_query,
-                    maxResults=50  # Start with a smaller number
-                ).execute()
-                
-                all_messages = result.get('messages', [])
-                st.info(f"📧 Found {len(all_messages)} total emails in date range")
-                
-                if len(all_messages) == 0:
-                    st.warning("No emails found in the specified date range. Try increasing the days back.")
-                    return []
-                
-            except Exception as e:
-                st.error(f"❌ Failed to access Gmail: {str(e)}")
-                return []
-            
-            # Search specifically for order confirmations, not promotions
-            order_terms = [
-                "order confirmation", 
-                "purchase confirmation",
-                "your order",
-                "order number",
-                "tracking number", 
-                "shipment confirmation",
-                "delivery confirmation",
-                "order receipt",
-                "thank you for your order"
-            ]
-            
-            # Exclude promotional terms
-            exclude_terms = [
-                "-unsubscribe",
-                "-promotional", 
-                "-sale",
-                "-deal",
-                "-offer",
-                "-discount",
-                "-newsletter"
-            ]
-            
-            # Build the query with proper string formatting
-            quoted_terms = [f'"{term}"' for term in order_terms]
-            terms_part = ' OR '.join(quoted_terms)
-            exclude_part = ' '.join(exclude_terms)
-            order_query = f"after:{start_date_str} before:{end_date_str} ({terms_part}) {exclude_part}"
+            order_query = f"after:{start_date_str} before:{end_date_str} {_ORDER_CLAUSE}"
             st.info(f"🔍 Searching for order confirmations: {order_query}")
             
+            # Only the first page is listed up front; the rest are listed
+            # while the emails already found are being fetched
             try:
-                result = self.service.users().messages().list(
-                    userId='me',
-                    q=order_query,
-                    maxResults=max_results
-                ).execute()
-                
-                messages = result.get('messages', [])
-                st.success(f"📧 Found {len(messages)} potential order emails")
-                
-                # If no order emails found, use broader search
-                if len(messages) == 0:
+                pages = self._iter_message_pages(order_query, max_results)
+                first_page = next(pages, [])
+                if not first_page:
                     st.info("No order-specific emails found, using broader search...")
-                    messages = all_messages[:max_results]  # Take from all emails
-                    
             except Exception as e:
                 st.warning(f"Order search failed: {str(e)}, using broader search")
-                messages = all_messages[:max_results]
-            
-            # Fetch full message details
-            emails = []
-            st.info(f"📥 Fetching details for {len(messages)} emails...")
+                first_page = []
             
-            for i, message in enumerate(messages):
+            # If no order emails found, use broader search; it only runs when
+            # needed, so a successful order search costs one listing
+            if not first_page:
+                simple_query = f"after:{start_date_str} before:{end_date_str}"
                 try:
-                    if i % 10 == 0:  # Show progress every 10 emails
-                        st.info(f"Processing email {i+1}/{len(messages)}")
-                    
-                    msg = self.service.users().messages().get(
-                        userId='me',
-                        id=message['id'],
-                        format='full'
-                    ).execute()
-                    
-                    email_data = self._parse_message(msg)
-                    if email_data:
-                        emails.append(email_data)
-                        
+                    pages = self._iter_message_pages(simple_query, max_results)
+                    first_page = next(pages, [])
                 except Exception as e:
-                    st.warning(f"Error fetching message {i+1}: {str(e)}")
-                    continue
+                    st.error(f"❌ Failed to access Gmail: {str(e)}")
+                    return []
+                
+                if not first_page:
+                    st.warning("No emails found in the specified date range. Try increasing the days back.")
+                    return []
+            
+            # One bar serves listing and both fetch passes
+            progress_bar = st.progress(0.0, text="📥 Fetching email details...")
+            messages, cached, fetched, headers_only, errors = self._fetch_pages(chain([first_page], pages), progress_bar)
+            progress_bar.empty()
+            
+            # Failures are collected rather than reported one banner at a time
+            if errors:
+                with st.expander(f"⚠️ Errors ({len(errors)})"):
+                    for request_id, error in errors:
+                        st.write(f"Error fetching message {request_id}: {str(error)}")
             
-            st.success(f"✅ Successfully fetched {len(emails)} emails")
+            if self.cache:
+                self.cache.set_many(fetched + headers_only)
+            
+            # Keep the order messages were listed in
+            by_id = {**cached, **{email_data['id']: email_data for email_data in fetched}}
+            emails = [by_id[m['id']] for m in messages if m['id'] in by_id]
+            
+            st.success(f"✅ Successfully fetched {len(emails)} of {len(messages)} emails found ({len(cached)} cached)")
             return emails
             
         except HttpError as error:
             st.error(f"An error occurred: {error}")
             return []
     
-    def _parse_message(self, message: Dict) -> Optional[Dict]:
-        """Parse Gmail message into structured data"""
+    def _open_cache(self):
+        """Open the signed-in account's message cache, if caching is enabled"""
+        if self.cache or not self.cache_dir:
+            return
         try:
-            headers = message['payload'].get('headers', [])
+            profile = self.service.users().getProfile(userId='me').execute(num_retries=self.LIST_RETRIES)
+            self.cache = MessageCache.for_account(profile['emailAddress'], self.cache_dir)
+        except Exception as e:
+            # Without knowing whose mail it is, nothing gets cached
+            st.warning(f"Message cache unavailable: {str(e)}")
+    
+    def clear_cache(self):
+        """Delete the cached messages of the signed-in account"""
+        self._open_cache()
+        if self.cache:
+            self.cache.clear()
+            self.cache = None
+    
+    def _iter_message_pages(self, query: str, max_results: int) -> Iterator[List[Dict]]:
+        """Pages of IDs of up to max_results messages matching query, following nextPageToken
+        
+        messages.list returns at most 500 IDs per page. Each page is only
+        requested once the previous one has been consumed.
+        """
+        listed = 0
+        page_token = None
+        while listed < max_results:
+            result = self.service.users().messages().list(
+                userId='me',
+                q=query,
+                maxResults=min(self.LIST_PAGE_SIZE, max_results - listed),
+                pageToken=page_token
+            ).execute(num_retries=self.LIST_RETRIES)
             
-            # Extract headers
-            subject = ''
-            sender = ''
-            date = ''
+            page = result.get('messages', [])[:max_results - listed]
+            listed += len(page)
+            yield page
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+    
+    def _fetch_pages(self, pages: Iterable[List[Dict]], progress_bar):
+        """List, fetch headers and fetch bodies as one pipeline
+        
+        Header batches for a page go to the worker threads as soon as it is
+        listed, and body batches as soon as enough subjects look order
+        related, including while later pages are still being listed, so
+        listing, metadata and raw requests overlap instead of running as
+        three sequential phases. Cached messages are not fetched again.
+        progress_bar is advanced as batches finish.
+        Returns (listed messages, {id: cached email}, fetched emails,
+        header-only emails rejected on subject, [(id, error)]).
+        """
+        messages = []
+        cached = {}
+        parsed = {}
+        headers_only = []
+        errors = []
+        candidates = []
+        formats = {}
+        chunks = {}
+        pending = set()
+        done = {'metadata': 0, 'raw': 0}
+        listing = True
+        shown = 0.0
+        
+        # Streamlit calls stay on this thread; workers only get the script
+        # context in case anything they call touches the session
+        with ThreadPoolExecutor(
+            max_workers=self.MAX_FETCH_WORKERS,
+            initializer=add_script_run_ctx,
+            initargs=(None, get_script_run_ctx())
+        ) as executor:
+            def submit(chunk: List[Dict], format: str):
+                future = executor.submit(self._fetch_chunk, chunk, format)
+                formats[future] = format
+                chunks[future] = chunk
+                pending.add(future)
             
-            for header in headers:
-                name = header.get('name', '').lower()
-                value = header.get('value', '')
+            def collect(timeout: Optional[float]):
+                """Take in finished batches, waiting up to timeout for one, then submit body batches"""
+                nonlocal candidates, shown
+                finished, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    pending.discard(future)
+                    try:
+                        chunk_parsed, chunk_errors = future.result()
+                    except Exception as e:
+                        # Whatever escaped the worker costs this batch only
+                        chunk_parsed, chunk_errors = {}, [(m['id'], e) for m in chunks[future]]
+                    errors.extend(chunk_errors)
+                    if formats[future] == 'metadata':
+                        for email_data in chunk_parsed.values():
+                            if _ORDER_SUBJECT_RE.search(email_data['subject']):
+                                candidates.append({'id': email_data['id']})
+                            else:
+                                headers_only.append({**email_data, 'body': None})
+                    else:
+                        parsed.update(chunk_parsed)
+                    done[formats[future]] += 1
                 
-                if name == 'subject':
-                    subject = value
-                elif name == 'from':
-                    sender = value
-                elif name == 'date':
-                    date = value
-            
-            # Extract body
-            body = self._extract_body(message['payload'])
+                # Full body batches go out as soon as they fill up; the
+                # remainder once every page is listed and every header batch is in
+                headers_pending = listing or any(formats[future] == 'metadata' for future in pending)
+                while len(candidates) >= self.batch_size or (candidates and not headers_pending):
+                    submit(candidates[:self.batch_size], 'raw')
+                    candidates = candidates[self.batch_size:]
+                
+                # The total grows as batches are submitted; never move the bar back
+                totals = {'metadata': 0, 'raw': 0}
+                for format in formats.values():
+                    totals[format] += 1
+                shown = max(shown, sum(done.values()) / len(formats)) if formats else shown
+                progress_bar.progress(shown, text=(
+                    f"📥 Listed {len(messages)} emails ({len(cached)} cached) · "
+                    f"headers {done['metadata']}/{totals['metadata']} · bodies {done['raw']}/{totals['raw']} batches"
+                ))
             
-            # Parse date
+            # Headers first: metadata responses are a few hundred bytes, so
+            # full bodies are only downloaded for plausible order emails
             try:
-                parsed_date = datetime.strptime(date, '%a, %d %b %Y %H:%M:%S %z')
-            except:
-                try:
-                    # Alternative date format
-                    parsed_date = datetime.strptime(date.split(' (')[0], '%a, %d %b %Y %H:%M:%S %z')
-                except:
-                    parsed_date = datetime.now(timezone.utc)
+                for page in pages:
+                    messages.extend(page)
+                    # Messages never change once sent, so anything fetched before is reused
+                    page_cached = self.cache.get_many([m['id'] for m in page]) if self.cache else {}
+                    uncached = [m for m in page if m['id'] not in page_cached]
+                    for message_id, email_data in page_cached.items():
+                        if email_data['body'] is not None:
+                            cached[message_id] = email_data
+                        elif _ORDER_SUBJECT_RE.search(email_data['subject']):
+                            # Rejected by an older subject filter; only the body is missing
+                            candidates.append({'id': message_id})
+                    for i in range(0, len(uncached), self.batch_size):
+                        submit(uncached[i:i + self.batch_size], 'metadata')
+                    # Don't block; the next page is listed while workers fetch
+                    collect(timeout=0)
+            except Exception as e:
+                # Keep whatever was listed before the failure
+                st.warning(f"Listing stopped after {len(messages)} emails: {str(e)}")
+            listing = False
             
-            return {
-                'id': message['id'],
-                'subject': subject,
-                'sender': sender,
-                'date': parsed_date,
-                'body': body
-            }
+            collect(timeout=0)
+            while pending:
+                collect(timeout=None)
+        
+        # Keep the order messages were listed in
+        fetched = [parsed[m['id']] for m in messages if m['id'] in parsed]
+        return messages, cached, fetched, headers_only, errors
+    
+    def _fetch_chunk(self, chunk: List[Dict], format: str = 'raw'):
+        """Fetch one batch of messages on a worker thread
+        
+        Messages rejected for rate limiting or by a server error, or whole
+        batches rejected that way or lost to a transport error, are retried
+        in a new batch with jittered exponential backoff. Returns
+        ({id: email_data}, [(id, error)]).
+        """
+        service = self._thread_service()
+        request_args = {'format': format}
+        if format == 'metadata':
+            request_args['metadataHeaders'] = self.METADATA_HEADERS
+        
+        parsed = {}
+        errors = []
+        pending = [message['id'] for message in chunk]
+        
+        for attempt in range(self.FETCH_RETRIES + 1):
+            if attempt:
+                # Jitter keeps the worker threads from retrying in lockstep
+                time.sleep(2 ** (attempt - 1) + random.random())
             
-        except Exception as e:
-            st.warning(f"Error parsing message: {str(e)}")
-            return None
+            retry = []
+            
+            def on_response(request_id, response, exception):
+                # A failed message does not abort the rest of its batch
+                if exception is None:
+                    try:
+                        parsed[request_id] = self._parse_message(response)
+                    except Exception as e:
+                        errors.append((request_id, e))
+                elif _is_retryable(exception) and attempt < self.FETCH_RETRIES:
+                    retry.append(request_id)
+                else:
+                    errors.append((request_id, exception))
+            
+            batch = service.new_batch_http_request(callback=on_response)
+            for message_id in pending:
+                batch.add(
+                    service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        **request_args
+                    ),
+                    request_id=message_id
+                )
+            try:
+                batch.execute()
+            except (HttpError, *_TRANSPORT_ERRORS) as e:
+                # The batch call itself failed, so messages without a callback
+                # yet were never answered
+                answered = set(parsed).union(message_id for message_id, _ in errors)
+                unanswered = [message_id for message_id in pending if message_id not in answered]
+                if not (_is_retryable(e) and attempt < self.FETCH_RETRIES):
+                    errors.extend((message_id, e) for message_id in unanswered)
+                    break
+                retry = unanswered
+            
+            pending = retry
+            if not pending:
+                break
+        
+        return parsed, errors
+    
+    def _thread_service(self):
+        """Gmail service for the current thread, as httplib2 connections are not thread-safe"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = _build_service(self.credentials)
+            self._local.service = service
+        return service
     
-    def _extract_body(self, payload: Dict) -> str:
-        """Extract email body from message payload"""
-        body = ""
+    def _parse_message(self, message: Dict) -> Dict:
+        """Parse Gmail message into structured data
         
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
-                        body += base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                elif part['mimeType'] == 'text/html':
-                    if 'data' in part['body']:
-                        body += base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                elif 'parts' in part:
-                    body += self._extract_body(part)
+        Full messages arrive as format='raw' RFC 822 bytes and are parsed
+        once, on the worker thread, for headers and body alike. The metadata
+        pass returns format='metadata' responses, which have headers but no
+        body. Malformed messages raise, and the caller records them as errors.
+        """
+        if 'raw' in message:
+            eml = email.message_from_bytes(
+                base64.urlsafe_b64decode(message['raw']),
+                policy=email.policy.default
+            )
+            subject = str(eml['subject'] or '')
+            sender = str(eml['from'] or '')
+            date = str(eml['date'] or '')
+            body = _extract_body(eml)
         else:
-            if payload['mimeType'] == 'text/plain' or payload['mimeType'] == 'text/html':
-                if 'data' in payload['body']:
-                    body += base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+            headers = message['payload'].get('headers', [])
+            
+            # Extract headers; on duplicates the last one wins, as before
+            values = {
+                name: header.get('value', '')
+                for header in headers
+                if (name := header.get('name', '').lower()) in _WANTED_HEADERS
+            }
+            subject = values.get('subject', '')
+            sender = values.get('from', '')
+            date = values.get('date', '')
+            body = ''
+        
+        # Parse date (RFC 2822, including trailing "(TZ)" comments)
+        try:
+            parsed_date = parsedate_to_datetime(date)
+        except (TypeError, ValueError):
+            parsed_date = datetime.now(timezone.utc)
+        if parsed_date.tzinfo is None:
+            # "-0000" means UTC with no known local offset
+            parsed_date = parsed_date.replace(tzinfo=timezone.utc)
         
-        return body
+        return {
+            'id': message['id'],
+            'subject': subject,
+            'sender': sender,
+            'date': parsed_date,
+            'body': body
+        }